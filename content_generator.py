@@ -3,15 +3,123 @@
 
 import os
 import re
+import html
 import json
 import time
+import bisect
 import random
+import hashlib
+import tempfile
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from pathlib import Path
 from urllib.parse import urlparse
-import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.utils import formatdate, formataddr
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:  # orjson is optional; stdlib json gives the same results
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+# Precompiled patterns used by ContentGenerator._ensure_clean_content / _clean_content
+_RE_FENCED = re.compile(r"```(?:\w+)?\n(.*?)\n```", re.DOTALL)
+# Cheap check that a {...} body has one of the keys we would extract
+_RE_MAYBE_POST_JSON = re.compile(r'"(?:post|content|text|body)"\s*:')
+# Literal backslash escapes (\n, \t, \", \\) that leak from JSON-ish output
+_RE_ESCAPE = re.compile(r'\\([nt"\\])')
+_ESCAPE_MAP = {"n": "\n", "t": "\t", '"': '"', "\\": "\\"}
+# Single cleanup pass: citations, 'Source:' lines, URLs, leaked JSON fragments
+# and code fences are dropped; Markdown bold/italic and inline code keep their text.
+_RE_CLEAN = re.compile(
+    r"(?P<cite>\[\s*\d+(?:\s*,\s*\d+)*\s*\]|\(\s*\d+\s*\))"
+    r"|(?P<src>(?i:\bSource\s*:\s*)https?://\S+)"
+    r"|(?P<url>https?://\S+)"
+    r'|(?P<kv>"[^"]*":\s*"[^"]*")'
+    r"|(?P<obj>\{[^}]*\})"
+    r"|(?P<fence>```)"
+    r"|\*{1,3}(?P<bold>[^*]+)\*{1,3}"
+    r"|`{1,3}(?P<code>[^`]+)`{1,3}"
+)
+
+
+def _clean_match(m: re.Match) -> str:
+    # Markdown keeps its inner text, itself cleaned (it may hold URLs/citations)
+    inner = m.group("bold") or m.group("code")
+    return _RE_CLEAN.sub(_clean_match, inner) if inner else ""
+
+
+# Runs of 3+ newlines collapse to a blank line, runs of spaces/tabs to one space
+_RE_WHITESPACE = re.compile(r"(?P<nl>\n{3,})|[ \t]{2,}")
+
+
+def _collapse_whitespace(m: re.Match) -> str:
+    return "\n\n" if m.group("nl") else " "
+
+
+def content_words(content: str) -> frozenset:
+    """Distinct lower-cased words of a post: the unit of the Jaccard duplicate check
+    (also stored as content_tokens by database.py)."""
+    return frozenset(content.lower().split())
+
+
+def content_hash(content: str) -> str:
+    """Hex SHA-256 of a post's content: the exact-duplicate key (also stored by database.py)."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# Leading list numbering and/or bullet on a trending-topic line ("1. ", "- ", "2. • ")
+_RE_BULLET = re.compile(r"^(?:\d+\.?\s*)?(?:[-•*]\s*)?")
+
+
+# Invariant parts of the Perplexity request made by ContentGenerator._api_post
+_POST_SYSTEM_PROMPT = (
+    "You are Anand Golla, a Master's student in Power Engineering at TUM with experience "
+    "in EV powertrain development at Royal Enfield. Write a professional LinkedIn post "
+    "about power electronics and EV technology. Use a technical but conversational tone, "
+    "include practical engineering insights, and structure content with clear points. "
+    "150-220 words. Include 3-5 relevant hashtags and end with a thoughtful question. "
+    "Use 0-2 emojis maximum. CRITICAL: No bracketed citations [1], [2] or (1). "
+    "No markdown formatting (**bold**, *italic*). Return plain text only."
+)
+_POST_REQUEST_PARAMS = {
+    "model": "sonar",
+    "temperature": 0.7,
+    "max_tokens": 700,
+    "return_citations": True,
+    "return_images": True,
+}
+
+# Fixed Perplexity request made by ContentGenerator._get_trending_topics
+_TRENDING_SYSTEM_PROMPT = (
+    "You are a technology research assistant. Provide 5 current trending topics "
+    "in electric vehicles and power electronics from the past 2 weeks. Focus on "
+    "OEM announcements, new technologies, partnerships, and industry developments. "
+    "Return ONLY topic titles, one per line, no numbering or bullets."
+)
+_TRENDING_USER_PROMPT = (
+    "What are the latest trending news and innovations in the EV industry from "
+    "major OEMs like Tesla, BMW, Mercedes, Audi, Ford, GM, Hyundai, Toyota, "
+    "BYD, NIO, Rivian, Lucid? Include power electronics, battery tech, charging "
+    "infrastructure, and autonomous driving developments from the past 2 weeks."
+)
+# Serialized once at import; the trending request never changes
+_TRENDING_REQUEST = _json_dumps({
+    "model": "sonar",
+    "messages": [
+        {"role": "system", "content": _TRENDING_SYSTEM_PROMPT},
+        {"role": "user", "content": _TRENDING_USER_PROMPT},
+    ],
+    "temperature": 0.3,  # Lower temperature for more focused results
+    "max_tokens": 400,
+    "return_citations": True,
+})
 
 
 class ContentGenerator:
@@ -25,7 +133,7 @@ class ContentGenerator:
 
     PPLX_URL = "https://api.perplexity.ai/chat/completions"
 
-    TOPIC_PILLARS = [
+    TOPIC_PILLARS = (
         "EV traction inverter design: SiC vs GaN trade-offs for 800V systems",
         "FOC control strategies for IPMSM: d-q axes optimization and torque ripple reduction",
         "On-board charger topologies: totem-pole PFC design and EMI mitigation",
@@ -45,10 +153,10 @@ class ContentGenerator:
         "Battery second-life applications: grid storage systems and capacity degradation models",
         "Electric vehicle platform architectures: skateboard vs integrated design approaches",
         "Power semiconductor reliability: MTBF analysis and failure mode prediction",
-        "EV charging network interoperability: roaming protocols and payment systems"
-    ]
+        "EV charging network interoperability: roaming protocols and payment systems",
+    )
 
-    TRUSTED_DOMAINS = {
+    TRUSTED_DOMAINS = frozenset({
         "ieee.org", "ieeexplore.ieee.org", "sae.org", "nrel.gov", "energy.gov",
         "iea.org", "iso.org", "iec.ch", "arxiv.org", "nature.com",
         "sciencedirect.com", "springer.com", "cell.com", "charin.global",
@@ -74,7 +182,7 @@ class ContentGenerator:
         # Indian auto industry forums and news
         "autocarindia.com", "autocarpro.in", "rushlane.com", "gaadiwaadi.com",
         "cardekho.com", "carwale.com", "zigwheels.com", "carandbike.com",
-        "team-bhp.com", "autocar.co.uk/india", "motorindiaonline.in",
+        "team-bhp.com", "motorindiaonline.in",
         "expressauto.in", "financialexpress.com", "business-standard.com",
         "livemint.com", "economictimes.indiatimes.com", "moneycontrol.com",
         # Indian technology and industry forums
@@ -82,14 +190,14 @@ class ContentGenerator:
         "assocham.org", "nasscom.in", "electronics.gov.in", "dst.gov.in",
         "niti.gov.in", "investindia.gov.in", "makeinindia.com",
         "electricvehicles.in", "evreporter.com", "evtales.com",
-        "cleantechnica.com/india", "inc42.com", "yourstory.com",
+        "inc42.com", "yourstory.com",
         # Indian research institutions
         "iitb.ac.in", "iitd.ac.in", "iitm.ac.in", "iitk.ac.in", "iisc.ac.in",
         "isro.gov.in", "drdo.gov.in", "csir.res.in", "nplindia.org",
         # Industry news
         "autonews.com", "automotive-news.com", "wardsauto.com",
         "teslarati.com", "cleantechnica.com", "electriveco.com"
-    }
+    })
 
     def __init__(self, api_key: str | None = None):
         self.api_key = api_key or os.getenv("PERPLEXITY_API_KEY")
@@ -103,147 +211,254 @@ class ContentGenerator:
         self.email_pass = os.getenv("EMAIL_PASS")
         self.email_from = os.getenv("EMAIL_FROM")
         self.email_to = os.getenv("EMAIL_TO")
+        self._smtp = None  # reused across digests, see _get_smtp
+        self._smtp_lock = threading.Lock()
 
         # Network defaults
         self.req_timeout = (12, 18)  # (connect, read)
         self.max_retries = 2
 
-    def generate_posts(self, existing_posts=None):
+        # One pooled keep-alive session for all Perplexity calls (built on first use)
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        # Opt-in on-disk response cache, keyed by request payload + ISO week. Off unless
+        # PPLX_CACHE_DIR is set: a cached answer would replay posts the user already
+        # rejected (and deleted) when they regenerate the same week.
+        cache_dir = os.getenv("PPLX_CACHE_DIR")
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else None
+        self.cache_ttl = 7 * 24 * 3600  # seconds
+
+        # Trending topics only change day to day: (utc_date, topics)
+        self._trending_cache = None
+
+    @property
+    def session(self):
+        """Shared requests.Session; requests is only imported once an API call is made."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from urllib3.util.retry import Retry
+
+                    # Transient failures (throttling, 5xx, failed connects) are retried
+                    # with backoff at the transport level, honouring Retry-After. Read
+                    # timeouts/errors are not: the completion may already be processed
+                    # and billed, and _generate_topic_post has its own attempts.
+                    retry = Retry(
+                        total=self.max_retries,
+                        read=0,
+                        backoff_factor=0.5,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=frozenset({"POST"}),
+                        raise_on_status=False,
+                    )
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=4, pool_maxsize=8, max_retries=retry
+                    )
+                    session.mount("https://", adapter)
+                    session.headers.update({
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json",
+                    })
+                    self._session = session
+        return self._session
+
+    def generate_posts(self, existing_posts=None, topics=None):
         """
         Generate posts with deduplication check.
         existing_posts: list of recent posts to check against for duplicates
+        topics: topics to write about (default: weekly_topics() for this batch)
         """
         existing_posts = existing_posts or []
         batch_time = datetime.now(timezone.utc)
-        topics = self._weekly_topics(batch_time)
-        results = []
+        if topics is None:
+            topics = self.weekly_topics(batch_time)
+        if not topics:
+            return []
+
+        # Word sets of recent posts are computed once and kept sorted by size, so the
+        # duplicate check only visits sets whose size could still match; posts accepted
+        # during this batch are inserted into the same list (under a lock).
+        seen_word_sets = sorted((self._existing_word_set(p) for p in existing_posts), key=len)
+        # Exact repeats are caught first by a set lookup on the stored content hashes
+        seen_hashes = {p["content_hash"] for p in existing_posts if p.get("content_hash")}
+
+        # Topics are independent API calls, so fetch them concurrently.
+        lock = threading.Lock()
+
+        def generate(topic):
+            return self._generate_topic_post(topic, batch_time, seen_word_sets, seen_hashes, lock)
+
+        with ThreadPoolExecutor(max_workers=len(topics)) as pool:
+            posts = list(pool.map(generate, topics))
+
+        return [p for p in posts if p]
+
+    def _generate_topic_post(self, topic, batch_time, seen_word_sets, seen_hashes, lock):
+        """Generate one post for a topic, retrying on API failure or duplicate content."""
         max_retries = 3
 
-        for topic in topics:
-            retry_count = 0
-            
-            while retry_count < max_retries:
-                content, url, image_url = self._api_post(topic)
-
-                if not content:
-                    retry_count += 1
-                    continue
-
-                # Clean content
-                content = self._ensure_clean_content(content)
-                
-                # Check for duplicates
-                temp_post = {"content": content}
-                if not self._is_duplicate_content(content, existing_posts + results):
-                    # Guarantee source URL
-                    if not url:
-                        url = self._get_fallback_source(topic)
-
-                    # Append source footer
-                    content = self._append_source_footer(content, url)
-
-                    results.append({
-                        "title": topic,
-                        "content": content,
-                        "created_at": datetime.now(timezone.utc),
-                        "source_url": url,
-                        "batch_timestamp": batch_time,
-                        "image_url": image_url,
-                    })
-                    break
-                else:
-                    print(f"Duplicate content detected for topic: {topic[:50]}...")
-                    retry_count += 1
+        for attempt in range(max_retries):
+            # Only the first attempt may be served from cache; retries need a fresh response
+            content, url, image_url = self._api_post(topic, use_cache=attempt == 0)
+
+            if not content:
+                if attempt < max_retries - 1:
+                    time.sleep(self._backoff_delay(attempt))
+                continue
+
+            # Clean content
+            content = self._ensure_clean_content(content)
+
+            # Guarantee source URL
+            if not url:
+                url = self._get_fallback_source(topic)
+
+            post = {
+                "title": topic,
+                # Append source footer
+                "content": self._append_source_footer(content, url),
+                "created_at": datetime.now(timezone.utc),
+                "source_url": url,
+                "batch_timestamp": batch_time,
+                "image_url": image_url,
+            }
+
+            # Check for duplicates: exact hash hit first, then word-set similarity
+            digest = post["content_hash"] = content_hash(post["content"])
+            words = content_words(content)
+            with lock:
+                if digest not in seen_hashes and not self._is_duplicate_content(words, seen_word_sets):
+                    seen_hashes.add(digest)
+                    bisect.insort(seen_word_sets, words, key=len)
+                    return post
 
-                time.sleep(0.8)
+            print(f"Duplicate content detected for topic: {topic[:50]}...")
 
-        return results
+        return None
 
-    def _weekly_topics(self, batch_time):
+    @staticmethod
+    def _backoff_delay(attempt: int, base: float = 1.0, cap: float = 8.0) -> float:
+        """Exponential backoff with jitter for retrying a failed topic."""
+        return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def weekly_topics(self, batch_time=None):
         """Return mix of trending news + core topics for this week."""
+        batch_time = batch_time or datetime.now(timezone.utc)
         # Get fresh trending topics
         trending = self._get_trending_topics()
         
         # Get deterministic core topics
-        week_seed = batch_time.isocalendar()[1]
-        random.seed(week_seed)
-        shuffled_core = self.TOPIC_PILLARS[:]
-        random.shuffle(shuffled_core)
+        shuffled_core = self._core_topics_for_week(batch_time.isocalendar()[1])
         
         # Mix: 3 trending + 2 core topics (or 4 core if no trending)
         if trending:
-            final_topics = trending[:3] + shuffled_core[:2]
+            final_topics = trending[:3] + list(shuffled_core[:2])
         else:
-            final_topics = shuffled_core[:5]
+            final_topics = list(shuffled_core[:5])
         
         return final_topics[:5]
 
-    def _api_post(self, topic):
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _core_topics_for_week(week_seed: int) -> tuple[str, ...]:
+        """TOPIC_PILLARS shuffled deterministically for the given week (local RNG, cached)."""
+        rng = random.Random(week_seed)
+        shuffled = list(ContentGenerator.TOPIC_PILLARS)
+        rng.shuffle(shuffled)
+        return tuple(shuffled)
+
+    def _api_post(self, topic, use_cache=True):
         """Call Perplexity API and return clean content, credible source, and image URL."""
         try:
-            system_prompt = (
-                "You are Anand Golla, a Master's student in Power Engineering at TUM with experience "
-                "in EV powertrain development at Royal Enfield. Write a professional LinkedIn post "
-                "about power electronics and EV technology. Use a technical but conversational tone, "
-                "include practical engineering insights, and structure content with clear points. "
-                "150-220 words. Include 3-5 relevant hashtags and end with a thoughtful question. "
-                "Use 0-2 emojis maximum. CRITICAL: No bracketed citations [1], [2] or (1). "
-                "No markdown formatting (**bold**, *italic*). Return plain text only."
-            )
-            user_prompt = (
-                f"Topic: {topic}. Focus on recent technical developments, practical trade-offs, "
-                "and engineering challenges. Include system-level considerations and real-world applications."
-            )
+            body = self._post_request_body(topic)
 
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-            data = {
-                "model": "sonar",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.7,
-                "max_tokens": 700,
-                "return_citations": True,
-                "return_images": True,
-            }
+            cache_path = self._cache_path(body) if self.cache_dir else None
+            if use_cache and cache_path:
+                cached = self._read_cache(cache_path)
+                if cached:
+                    return cached
 
-            r = requests.post(self.PPLX_URL, headers=headers, json=data, timeout=self.req_timeout)
+            r = self.session.post(self.PPLX_URL, data=body, timeout=self.req_timeout)
             r.raise_for_status()
-            resp = r.json()
+            resp = _json_loads(r.content)
 
             # Extract text
-            raw = resp.get("choices", [{}])[0].get("message", {}).get("content", "") or ""
+            try:
+                raw = resp["choices"][0]["message"]["content"] or ""
+            except (KeyError, IndexError, TypeError):
+                raw = ""
             content = raw.strip()
 
-            # Extract credible source from citations
-            source_url = None
-            for cit in (resp.get("citations") or []):
-                url = cit["url"] if isinstance(cit, dict) else str(cit)
-                if self._is_credible_source(url):
-                    source_url = url
-                    break
-
-            # Extract first image URL if present
-            image_url = None
-            for img in (resp.get("images") or []):
-                if isinstance(img, dict):
-                    image_url = img.get("image_url") or img.get("url")
-                    if image_url:
-                        break
-                elif isinstance(img, str):
-                    image_url = img
-                    break
+            # Extract first credible source from citations (stops at the first hit)
+            citation_urls = (
+                c.get("url") if isinstance(c, dict) else str(c)
+                for c in (resp.get("citations") or ())
+            )
+            source_url = next((u for u in citation_urls if self._is_credible_source(u)), None)
 
+            # Extract first image URL if present (stops at the first hit)
+            image_urls = (
+                (img.get("image_url") or img.get("url")) if isinstance(img, dict)
+                else img if isinstance(img, str) else None
+                for img in (resp.get("images") or ())
+            )
+            image_url = next((u for u in image_urls if u), None)
+
+            if content and cache_path:
+                self._write_cache(cache_path, (content, source_url, image_url))
             return content, source_url, image_url
 
         except Exception as e:
             print(f"Error calling Perplexity API: {e}")
             return None, None, None
 
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _post_request_body(topic: str) -> bytes:
+        """Serialized _api_post request for a topic, built once and reused across retries."""
+        user_prompt = (
+            f"Topic: {topic}. Focus on recent technical developments, practical trade-offs, "
+            "and engineering challenges. Include system-level considerations and real-world applications."
+        )
+        return _json_dumps({
+            **_POST_REQUEST_PARAMS,
+            "messages": [
+                {"role": "system", "content": _POST_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ],
+        })
+
+    def _cache_path(self, body: bytes) -> Path:
+        """Cache file for a serialized request payload; the ISO week is part of the key."""
+        year, week, _ = datetime.now(timezone.utc).isocalendar()
+        h = hashlib.sha256(body)
+        h.update(f"{year}-W{week}".encode("ascii"))
+        return self.cache_dir / f"{h.hexdigest()}.json"
+
+    def _read_cache(self, path: Path):
+        """Return a cached (content, source_url, image_url) tuple, or None if missing/stale."""
+        try:
+            if time.time() - path.stat().st_mtime > self.cache_ttl:
+                return None
+            with path.open(encoding="utf-8") as f:
+                return tuple(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, path: Path, value) -> None:
+        """Atomically write a cache entry; failures are logged and ignored."""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(list(value), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Failed to write API cache: {e}")
+
     def _ensure_clean_content(self, content: str) -> str:
         """Ensure content is plain text (no JSON blocks) and fully cleaned."""
         if not content:
@@ -252,14 +467,14 @@ class ContentGenerator:
         t = content.strip()
 
         # If fenced code block
-        fenced = re.search(r"```(?:\w+)?\n(.*?)\n```", t, re.DOTALL)
+        fenced = _RE_FENCED.search(t)
         if fenced:
             t = fenced.group(1).strip()
 
         # If content looks like JSON, try parsing for 'post'/'content' fields
-        if t.startswith("{") and t.endswith("}"):
+        if t.startswith("{") and t.endswith("}") and _RE_MAYBE_POST_JSON.search(t):
             try:
-                data = json.loads(t)
+                data = _json_loads(t)
                 for key in ("post", "content", "text", "body"):
                     if isinstance(data.get(key), str) and len(data[key]) > 20:
                         t = data[key]
@@ -274,29 +489,17 @@ class ContentGenerator:
         if not content:
             return ""
 
-        # Remove bracketed and numeric citations
-        content = re.sub(r"\[\s*\d+(?:\s*,\s*\d+)*\s*\]", "", content)
-        content = re.sub(r"\(\s*\d+\s*\)", "", content)
-
-        # Remove 'Source:' lines and inline URLs
-        content = re.sub(r"(?i)\bSource\s*:\s*https?://\S+", "", content)
-        content = re.sub(r"https?://\S+", "", content)
-
-        # Remove JSON-like key-value fragments that sometimes leak
-        content = re.sub(r'"[^"]*":\s*"[^"]*"', "", content)
-        content = re.sub(r"\{[^}]*\}", "", content)
-
-        # Decode common escapes
-        content = content.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\")
+        # Decode common escapes (skipped when there is no backslash at all)
+        if "\\" in content:
+            content = _RE_ESCAPE.sub(lambda m: _ESCAPE_MAP[m.group(1)], content)
 
-        # Strip Markdown formatting
-        content = re.sub(r"\*{1,3}([^*]+)\*{1,3}", r"\1", content)   # **bold**, *italic*
-        content = re.sub(r"`{1,3}([^`]+)`{1,3}", r"\1", content)     # `code`
-        content = re.sub(r"```", "", content)                        # code fences
+        # Remove citations, 'Source:' lines, inline URLs, JSON fragments and
+        # code fences; strip Markdown markers
+        content = _RE_CLEAN.sub(_clean_match, content)
 
         # Normalize whitespace
-        content = re.sub(r'\n{3,}', '\n\n', content)
-        content = re.sub(r'[ \t]{2,}', ' ', content)
+        if "\n\n\n" in content or "  " in content or "\t" in content:
+            content = _RE_WHITESPACE.sub(_collapse_whitespace, content)
 
         return content.strip()
 
@@ -309,13 +512,30 @@ class ContentGenerator:
         return content.rstrip() + f"\n\nSource: {source_url}"
 
     def _is_credible_source(self, url: str | None) -> bool:
+        """True if the URL's host is a trusted domain or a subdomain of one."""
         if not url:
             return False
         try:
-            domain = urlparse(url).netloc.lower().replace("www.", "")
-            return any(trusted in domain for trusted in self.TRUSTED_DOMAINS)
+            domain = self._url_host(url).removeprefix("www.")
         except Exception:
             return False
+        # Probe each dot-suffix ("a.b.ieee.org" -> "b.ieee.org" -> "ieee.org" -> "org")
+        trusted = self.TRUSTED_DOMAINS
+        while domain:
+            if domain in trusted:
+                return True
+            domain = domain.partition(".")[2]
+        return False
+
+    @staticmethod
+    def _url_host(url: str) -> str:
+        """Lower-cased host of a URL; plain string splits for scheme://host/... URLs."""
+        _, sep, rest = url.partition("://")
+        if not sep or rest.startswith("["):
+            # No scheme separator or an IPv6 literal: let urlparse handle it
+            return urlparse(url).hostname or ""
+        netloc = rest.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]
+        return netloc.rpartition("@")[2].partition(":")[0].lower()
 
     def _get_fallback_source(self, topic: str) -> str:
         t = topic.lower()
@@ -329,7 +549,9 @@ class ContentGenerator:
 
     def build_email_digest(self, posts):
         """Build email digest for post review."""
-        dt = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        # Reuse the batch timestamp generate_posts already stamped on the posts
+        batch_time = posts[0].get("batch_timestamp") if posts else None
+        dt = (batch_time or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
         subject = f"LinkedIn posts ready for review — {dt}"
 
         html_lines = [
@@ -345,39 +567,56 @@ class ContentGenerator:
             ""
         ]
 
+        esc = self._esc
+        text_rule = "-" * 40
         for i, p in enumerate(posts, 1):
-            html_lines.append(f"<h3>Post {i}: {self._esc(p.get('title',''))}</h3>")
-            html_lines.append(f"<p>{self._esc(p.get('content',''))}</p>")
-            if p.get("source_url"):
-                html_lines.append(f'<p><a href="{p["source_url"]}">Source</a></p>')
-
-            text_lines.extend([
-                f"\nPost {i}: {p.get('title','')}",
-                "-" * 40,
-                p.get('content',''),
-                f"Source: {p.get('source_url', 'N/A')}\n",
-            ])
+            title = p.get("title", "")
+            content = p.get("content", "")
+            source_url = p.get("source_url")
+
+            html_lines.extend((f"<h3>Post {i}: {esc(title)}</h3>", f"<p>{esc(content)}</p>"))
+            if source_url:
+                html_lines.append(f'<p><a href="{esc(source_url)}">Source</a></p>')
+
+            text_lines.extend((
+                f"\nPost {i}: {title}",
+                text_rule,
+                content,
+                f"Source: {source_url or 'N/A'}\n",
+            ))
 
         return subject, "\n".join(html_lines), "\n".join(text_lines)
 
+    @property
+    def email_configured(self) -> bool:
+        """True when the SMTP settings needed to send the digest are all present."""
+        return all([self.email_host, self.email_user, self.email_pass, self.email_to])
+
     def send_email_digest(self, posts):
         """Send email digest if configured."""
-        if not all([self.email_host, self.email_user, self.email_pass, self.email_to]):
+        if not self.email_configured:
             print("Email configuration incomplete; skipping email")
             return False
 
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.utils import formatdate, formataddr
+
         try:
             subject, html_body, _ = self.build_email_digest(posts)
-            msg = MIMEText(html_body, "html")
+            msg = MIMEText(html_body, "html", "utf-8")
             msg["Subject"] = subject
             msg["From"] = formataddr(('LinkedIn Automation', self.email_from or self.email_user))
             msg["To"] = self.email_to
             msg["Date"] = formatdate(localtime=True)
 
-            with smtplib.SMTP(self.email_host, self.email_port) as server:
-                server.starttls()
-                server.login(self.email_user, self.email_pass)
-                server.send_message(msg)
+            with self._smtp_lock:
+                try:
+                    self._get_smtp().send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # Dropped between the liveness check and the send; reconnect once
+                    self._close_smtp()
+                    self._get_smtp().send_message(msg)
 
             print(f"Email digest sent successfully to {self.email_to}")
             return True
@@ -385,84 +624,120 @@ class ContentGenerator:
             print(f"Failed to send email: {e}")
             return False
 
+    def _get_smtp(self):
+        """Return a logged-in SMTP connection, reusing the previous one while it is alive."""
+        import smtplib
+
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+
+        # The connection idles between digests; a socket timeout keeps the NOOP probe
+        # (and any send) from hanging on a connection a NAT/LB silently dropped
+        timeout = self.req_timeout[0]
+        if self.email_port == 465:
+            # Implicit TLS: no STARTTLS round trip
+            server = smtplib.SMTP_SSL(self.email_host, self.email_port, timeout=timeout)
+        else:
+            server = smtplib.SMTP(self.email_host, self.email_port, timeout=timeout)
+        try:
+            if self.email_port != 465:
+                server.starttls()
+            server.login(self.email_user, self.email_pass)
+        except BaseException:
+            # Don't leak the socket when the handshake or authentication fails
+            server.close()
+            raise
+        self._smtp = server
+        return server
+
+    def _close_smtp(self):
+        """Drop the cached SMTP connection, if any."""
+        server, self._smtp = self._smtp, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def close(self):
+        """Release pooled HTTP and SMTP connections."""
+        with self._smtp_lock:
+            self._close_smtp()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
     def _esc(self, text: str | None) -> str:
         """HTML escape helper."""
         if not text:
             return ""
-        return (
-            text.replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace('"', "&quot;")
-                .replace("'", "&#x27;")
-        )
+        return html.escape(text, quote=True)
 
     def _get_trending_topics(self):
-        """Get trending EV news topics from Perplexity API."""
-        try:
-            system_prompt = (
-                "You are a technology research assistant. Provide 5 current trending topics "
-                "in electric vehicles and power electronics from the past 2 weeks. Focus on "
-                "OEM announcements, new technologies, partnerships, and industry developments. "
-                "Return ONLY topic titles, one per line, no numbering or bullets."
-            )
-            user_prompt = (
-                "What are the latest trending news and innovations in the EV industry from "
-                "major OEMs like Tesla, BMW, Mercedes, Audi, Ford, GM, Hyundai, Toyota, "
-                "BYD, NIO, Rivian, Lucid? Include power electronics, battery tech, charging "
-                "infrastructure, and autonomous driving developments from the past 2 weeks."
-            )
+        """Get trending EV news topics from Perplexity API (cached for the UTC day)."""
+        today = datetime.now(timezone.utc).date()
+        if self._trending_cache and self._trending_cache[0] == today:
+            return list(self._trending_cache[1])
 
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-            data = {
-                "model": "sonar",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.3,  # Lower temperature for more focused results
-                "max_tokens": 400,
-                "return_citations": True,
-            }
-
-            r = requests.post(self.PPLX_URL, headers=headers, json=data, timeout=self.req_timeout)
+        try:
+            r = self.session.post(self.PPLX_URL, data=_TRENDING_REQUEST, timeout=self.req_timeout)
             r.raise_for_status()
-            resp = r.json()
+            resp = _json_loads(r.content)
 
-            content = resp.get("choices", [{}])[0].get("message", {}).get("content", "") or ""
+            try:
+                content = resp["choices"][0]["message"]["content"] or ""
+            except (KeyError, IndexError, TypeError):
+                content = ""
             
             # Parse topics from response
             topics = []
-            for line in content.strip().split('\n'):
+            for line in content.splitlines():
                 line = line.strip()
-                if line and len(line) > 10:  # Filter out short/empty lines
+                if len(line) > 10:  # Filter out short/empty lines
                     # Clean up any numbering or bullets
-                    line = re.sub(r'^\d+\.?\s*', '', line)
-                    line = re.sub(r'^[-•*]\s*', '', line)
-                    topics.append(line)
+                    topics.append(_RE_BULLET.sub("", line, count=1))
             
-            return topics[:5]  # Return max 5 topics
+            topics = topics[:5]  # Return max 5 topics
+            if topics:
+                self._trending_cache = (today, tuple(topics))
+            return topics
             
         except Exception as e:
             print(f"Error getting trending topics: {e}")
             return []
 
-    def _is_duplicate_content(self, new_content: str, existing_posts: list) -> bool:
-        """Check if content is too similar to existing posts."""
-        import difflib
-        
-        new_words = set(new_content.lower().split())
-        
-        for existing in existing_posts:
-            existing_words = set(existing.get('content', '').lower().split())
-            
-            # Calculate similarity ratio
-            similarity = len(new_words & existing_words) / len(new_words | existing_words)
-            
-            if similarity > 0.7:  # 70% similarity threshold
+    def _existing_word_set(self, post: dict) -> frozenset:
+        """Word set of a stored post, using its precomputed content_tokens when present."""
+        tokens = post.get("content_tokens")
+        if tokens is not None:
+            return frozenset(tokens)
+        return content_words(post.get("content", ""))
+
+    def _is_duplicate_content(self, new_words: frozenset, existing_word_sets: list) -> bool:
+        """
+        Check if a post's word set is too similar to any existing post's word set.
+        existing_word_sets: word sets sorted by size (see generate_posts)
+        """
+        threshold = 0.7  # 70% Jaccard similarity
+        n = len(new_words)
+        if not n:
+            return False
+
+        # Jaccard can't exceed min/max of the set sizes, so only sets sized strictly
+        # between threshold*n and n/threshold can match; bisect to that window
+        lo = bisect.bisect_right(existing_word_sets, threshold * n, key=len)
+        hi = bisect.bisect_left(existing_word_sets, n / threshold, key=len)
+
+        for existing_words in existing_word_sets[lo:hi]:
+            m = len(existing_words)
+            common = len(new_words & existing_words)
+            if common / (n + m - common) > threshold:
                 return True
-        
+
         return False
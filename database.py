@@ -9,7 +9,9 @@ Document structure:
   is_approved: bool,
   source_url: str | None,
   batch_timestamp: datetime (UTC),
-  image_url: str | None
+  image_url: str | None,
+  content_tokens: list[str]  (distinct lower-cased words, for duplicate checks)
+  content_hash: str  (sha256 of the content as generated; unique)
 }
 """
 from __future__ import annotations
@@ -18,8 +20,11 @@ import os
 from datetime import datetime, timezone, timedelta
 from typing import Any, Dict, List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
 import certifi # Ensures we have the latest SSL certificates
+from content_generator import content_hash, content_words
 
 # This order helps ensure the right environment variable is found.
 # In Render, you should set MONGO_URI.
@@ -34,10 +39,35 @@ if not MONGO_URI:
 DB_NAME = os.getenv("MONGODB_DB", "linkedin_automation")
 COLLECTION_NAME = os.getenv("MONGODB_COLLECTION", "posts")
 
+# Connection pool sizing for the shared client (dashboard + generation traffic)
+MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "20"))
+MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "2"))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "30000"))
+
 _client: AsyncIOMotorClient | None = None
 _db: AsyncIOMotorDatabase | None = None
 _collection: AsyncIOMotorCollection | None = None
 
+# Fields the dashboard renders; everything else stays on the server
+LIST_PROJECTION = {
+    "content": 1,
+    "created_at": 1,
+    "is_approved": 1,
+    "source_url": 1,
+    "image_url": 1,
+}
+
+# Dashboard filter -> query, built once; unknown filters list everything
+LIST_QUERIES: Dict[str, Dict[str, Any]] = {
+    "all": {},
+    "approved": {"is_approved": True},
+    "pending": {"is_approved": False},
+}
+# Newest first; _id breaks created_at ties so keyset pages never skip or repeat a post
+LIST_SORT = [("created_at", -1), ("_id", -1)]
+# Posts per dashboard page
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+
 
 def get_client() -> AsyncIOMotorClient:
     global _client, _db, _collection
@@ -47,6 +77,13 @@ def get_client() -> AsyncIOMotorClient:
         _client = AsyncIOMotorClient(
             MONGO_URI,
             serverSelectionTimeoutMS=8000,
+            # Keep a few warm connections so requests skip the TCP+TLS handshake,
+            # and bound how long a request waits for one when the pool is busy
+            maxPoolSize=MAX_POOL_SIZE,
+            minPoolSize=MIN_POOL_SIZE,
+            waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+            # Recycle pooled connections that sit idle for 30 minutes
+            maxIdleTimeMS=1_800_000,
             # These two lines are crucial for Render/Heroku/Docker environments
             tls=True,
             tlsCAFile=ca
@@ -56,6 +93,14 @@ def get_client() -> AsyncIOMotorClient:
     return _client
 
 
+def close_client() -> None:
+    """Close the shared client (if created) and its connection pool."""
+    global _client, _db, _collection
+    if _client is not None:
+        _client.close()
+    _client = _db = _collection = None
+
+
 def get_collection() -> AsyncIOMotorCollection:
     if _collection is None:
         get_client()
@@ -73,25 +118,93 @@ async def ping() -> bool:
         return False
 
 
+def content_tokens(content: str) -> List[str]:
+    """Stored form of content_words(): a sorted list, as BSON has no set type."""
+    return sorted(content_words(content))
+
+
+async def ensure_indexes() -> None:
+    """Create the indexes used by list/recent queries and batch pruning (idempotent)."""
+    col = get_collection()
+    await col.create_indexes([
+        IndexModel([("created_at", -1), ("_id", -1)]),
+        # Filtered dashboard lists: equality on is_approved, then newest first
+        IndexModel([("is_approved", 1), ("created_at", -1), ("_id", -1)]),
+        IndexModel([("batch_timestamp", 1), ("is_approved", 1)]),
+        # Exact-duplicate guard; posts saved before content_hash existed are exempt
+        IndexModel(
+            [("content_hash", 1)],
+            unique=True,
+            partialFilterExpression={"content_hash": {"$exists": True}},
+        ),
+    ])
+
+
 async def create_posts(posts: List[Dict[str, Any]]) -> List[str]:
     if not posts:
         return []
+    now = datetime.now(timezone.utc)
     for p in posts:
-        p.setdefault("created_at", datetime.now(timezone.utc))
+        p.setdefault("created_at", now)
         p.setdefault("is_approved", False)
+        p.setdefault("content_tokens", content_tokens(p.get("content", "")))
+        p.setdefault("content_hash", content_hash(p.get("content", "")))
     col = get_collection()
-    res = await col.insert_many(posts)
+    # Posts are independent: unordered inserts let one bad document fail alone,
+    # and a post whose content_hash already exists is simply skipped
+    try:
+        res = await col.insert_many(posts, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        failed = {err["index"] for err in errors}
+        duplicates = sum(1 for err in errors if err.get("code") == 11000)
+        if duplicates:
+            print(f"Skipped {duplicates} of {len(posts)} posts with duplicate content.")
+        if len(failed) > duplicates:
+            print(f"Failed to insert {len(failed) - duplicates} of {len(posts)} posts: "
+                  f"{[err for err in errors if err.get('code') != 11000]}")
+        # insert_many assigns _id on each document before sending
+        return [str(p["_id"]) for i, p in enumerate(posts) if i not in failed]
     return [str(_id) for _id in res.inserted_ids]
 
 
-async def list_posts(filter_type: str = "all") -> List[Dict[str, Any]]:
+def page_cursor(post: Dict[str, Any]) -> str:
+    """Keyset cursor for the page after a listed post: "<created_at iso>_<id>"."""
+    return f"{post['created_at'].isoformat()}_{post['id']}"
+
+
+def _before_cursor(before: str) -> Optional[Dict[str, Any]]:
+    """Query for posts sorted after the cursor (see LIST_SORT); None if malformed."""
+    ts, _, post_id = before.rpartition("_")
+    try:
+        created_at = datetime.fromisoformat(ts)
+        oid = ObjectId(post_id)
+    except Exception:
+        return None
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": oid}},
+    ]}
+
+
+def stored_posts(posts: List[Dict[str, Any]], ids: List[str]) -> List[Dict[str, Any]]:
+    """The posts create_posts actually stored (not skipped duplicates), given its ids."""
+    saved = set(ids)
+    return [p for p in posts if str(p.get("_id")) in saved]
+
+
+async def list_posts(
+    filter_type: str = "all",
+    before: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+) -> List[Dict[str, Any]]:
+    """Newest posts for a filter, starting after the `before` cursor (first page if None)."""
     col = get_collection()
-    query: Dict[str, Any] = {}
-    if filter_type == "approved":
-        query["is_approved"] = True
-    elif filter_type == "pending":
-        query["is_approved"] = False
-    cursor = col.find(query).sort("created_at", -1)
+    query = LIST_QUERIES.get(filter_type, LIST_QUERIES["all"])
+    after = _before_cursor(before) if before else None
+    if after:
+        query = {**query, **after}
+    cursor = col.find(query, LIST_PROJECTION).sort(LIST_SORT).limit(limit)
     docs: List[Dict[str, Any]] = []
     async for doc in cursor:
         doc["id"] = str(doc.pop("_id"))
@@ -99,14 +212,36 @@ async def list_posts(filter_type: str = "all") -> List[Dict[str, Any]]:
     return docs
 
 
+async def count_posts(filter_type: str = "all") -> Dict[str, int]:
+    """Total and approved post counts for a filter, in one aggregation round trip."""
+    col = get_collection()
+    query = LIST_QUERIES.get(filter_type, LIST_QUERIES["all"])
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "approved": {"$sum": {"$cond": ["$is_approved", 1, 0]}},
+        }},
+    ]
+    async for doc in col.aggregate(pipeline):
+        return {"total": doc["total"], "approved": doc["approved"]}
+    return {"total": 0, "approved": 0}
+
+
 async def get_recent_posts(days: int = 30) -> List[Dict[str, Any]]:
     col = get_collection()
     cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-    cursor = col.find({"created_at": {"$gte": cutoff}}, {"content": 1})
-    docs: List[Dict[str, Any]] = []
-    async for doc in cursor:
-        docs.append({"content": doc.get("content", "")})
-    return docs
+    # Only the stored word list and hash go over the wire; older posts saved
+    # before content_tokens existed fall back to sending their content.
+    projection = {
+        "_id": 0,
+        "content_tokens": 1,
+        "content_hash": 1,
+        "content": {"$cond": [{"$isArray": "$content_tokens"}, "$$REMOVE", "$content"]},
+    }
+    cursor = col.find({"created_at": {"$gte": cutoff}}, projection)
+    return [doc async for doc in cursor]
 
 
 async def approve_post(post_id: str) -> bool:
@@ -115,11 +250,15 @@ async def approve_post(post_id: str) -> bool:
         oid = ObjectId(post_id)
     except Exception:
         return False
-    post = await col.find_one({"_id": oid})
+    post = await col.find_one_and_update(
+        {"_id": oid},
+        {"$set": {"is_approved": True}},
+        projection={"batch_timestamp": 1},
+        return_document=ReturnDocument.AFTER,
+    )
     if not post:
         return False
     batch_ts = post.get("batch_timestamp")
-    await col.update_one({"_id": oid}, {"$set": {"is_approved": True}})
     if batch_ts:
         await col.delete_many({
             "batch_timestamp": batch_ts,
@@ -135,8 +274,12 @@ async def update_post_content(post_id: str, content: str) -> bool:
         oid = ObjectId(post_id)
     except Exception:
         return False
-    res = await col.update_one({"_id": oid}, {"$set": {"content": content}})
-    return res.modified_count == 1
+    res = await col.update_one(
+        {"_id": oid},
+        {"$set": {"content": content, "content_tokens": content_tokens(content)}},
+    )
+    # matched, not modified: saving unchanged text is still a success
+    return res.matched_count == 1
 
 
 async def delete_post(post_id: str) -> bool:
@@ -1,53 +1,206 @@
 # Automations/main.py
-from fastapi import FastAPI, Request, Form, Query, HTTPException
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Request, Form, Query, HTTPException
+from fastapi.responses import Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 import os
+import json
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from database import (
+    close_client,
+    ensure_indexes,
+    PAGE_SIZE,
+    page_cursor,
     list_posts,
+    count_posts,
     get_recent_posts,
     create_posts,
+    stored_posts,
     approve_post as approve_post_db,
     update_post_content,
     delete_post as delete_post_db,
 )
 from content_generator import ContentGenerator
+from run_scheduler import scheduled_generate
+
+try:
+    from orjson import dumps as json_dumps
+except ImportError:  # orjson is optional, as in content_generator
+    def json_dumps(obj) -> bytes:
+        # default=str covers the datetimes in dashboard page data
+        return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
 
 # Load environment variables
 load_dotenv()
 if not os.getenv("PERPLEXITY_API_KEY"):
     raise RuntimeError("Missing required environment variable: PERPLEXITY_API_KEY")
 
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
+@asynccontextmanager
+async def lifespan(app):
+    # Create DB indexes once at startup (no-op if they already exist) and start the
+    # optional in-process schedule
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        print(f"Failed to ensure database indexes: {e}")
+    if SCHEDULER_CRON:
+        scheduler.add_job(run_scheduled_generation, CronTrigger.from_crontab(SCHEDULER_CRON, timezone="UTC"))
+        scheduler.start()
+    yield
+    # Release the scheduler, pooled HTTP/SMTP connections and the DB client
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    content_generator.close()
+    close_client()
+
+app = FastAPI(lifespan=lifespan)
+# Compiled templates are cached on disk so cold workers skip parsing; templates are
+# only re-checked on disk when TEMPLATES_AUTO_RELOAD is set (local development).
+# Without JINJA_CACHE_DIR, Jinja uses its own per-user 0700 temp directory and
+# verifies its ownership before loading any bytecode from it.
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR")
+if JINJA_CACHE_DIR:
+    os.makedirs(JINJA_CACHE_DIR, mode=0o700, exist_ok=True)
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=True,
+    bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR),
+    auto_reload=os.getenv("TEMPLATES_AUTO_RELOAD", "").lower() in ("1", "true", "yes"),
+))
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Fixed replies of the mutation endpoints, encoded once
+APPROVED_BODY = json_dumps({"message": "Post approved and others deleted"})
+UPDATED_BODY = json_dumps({"message": "Post updated"})
+DELETED_BODY = json_dumps({"message": "Post deleted successfully"})
+
+def json_body(body):
+    return Response(content=body, media_type="application/json")
+
 # Initialize content generator
 content_generator = ContentGenerator(os.getenv("PERPLEXITY_API_KEY"))
 
+# Dashboard page cache: (filter, before) -> (expires_at, (posts, counts, next_before, digest)).
+# Mutating endpoints clear it; the TTL bounds staleness from writes made elsewhere
+# (e.g. the scheduled job). digest fingerprints the page data for the ETag.
+# The cache is per process, so a write handled by one worker can't clear another's;
+# it is off unless DASHBOARD_CACHE_TTL is set, which is only safe with one worker.
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "0"))
+DASHBOARD_CACHE_MAX = 64
+_dashboard_cache = {}
+# Bumped by every invalidation; a read that started before a write must not be cached
+_dashboard_generation = 0
+
+async def get_dashboard_page(filter_type, before):
+    key = (filter_type, before)
+    now = time.monotonic()
+    cached = _dashboard_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    generation = _dashboard_generation
+    # One extra row tells whether an older page exists
+    posts, counts = await asyncio.gather(
+        list_posts(filter_type, before, PAGE_SIZE + 1), count_posts(filter_type)
+    )
+    next_before = page_cursor(posts[PAGE_SIZE - 1]) if len(posts) > PAGE_SIZE else None
+    posts = posts[:PAGE_SIZE]
+    digest = hashlib.sha1(json_dumps([posts, counts, next_before])).hexdigest()
+    data = (posts, counts, next_before, digest)
+    if DASHBOARD_CACHE_TTL > 0 and generation == _dashboard_generation:
+        if len(_dashboard_cache) >= DASHBOARD_CACHE_MAX:
+            _dashboard_cache.clear()
+        _dashboard_cache[key] = (now + DASHBOARD_CACHE_TTL, data)
+    return data
+
+def invalidate_dashboard_cache():
+    global _dashboard_generation
+    _dashboard_generation += 1
+    _dashboard_cache.clear()
+
+# Part of every dashboard ETag, so a redeployed template is never served from a
+# browser's cached copy
+DASHBOARD_TEMPLATE_VERSION = str(os.path.getmtime(os.path.join("templates", "dashboard.html")))
+
+def etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in header.split(","))
+
+# Optional in-process schedule (crontab syntax, UTC), e.g. SCHEDULER_CRON="0 10 * * 1".
+# Off by default: the GitHub Actions workflow runs run_scheduler.py, and with several
+# web workers each one would fire the job.
+SCHEDULER_CRON = os.getenv("SCHEDULER_CRON")
+scheduler = AsyncIOScheduler(timezone="UTC")
+
+async def run_scheduled_generation():
+    # Runs on the app's event loop, sharing its DB client and content generator
+    await scheduled_generate(content_generator)
+    invalidate_dashboard_cache()
+
 @app.get("/")
 async def dashboard(
     request: Request,
     filter: str = Query("all"),
+    before: str | None = Query(None),
 ):
-    posts = await list_posts(filter)
+    # list_posts treats any unknown filter as "all"; normalise so the cache stays bounded
+    filter_key = filter if filter in ("approved", "pending") else "all"
+    posts, counts, next_before, digest = await get_dashboard_page(filter_key, before)
+
+    # Browsers revalidate on every load; an unchanged page costs a 304 with no render
+    etag_source = f"{DASHBOARD_TEMPLATE_VERSION}:{filter}:{before}:{digest}"
+    etag = f'"{hashlib.sha1(etag_source.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
     return templates.TemplateResponse(
+        request,
         "dashboard.html",
-        {"request": request, "posts": posts, "filter": filter}
+        {
+            "posts": posts,
+            "counts": counts,
+            "filter": filter,
+            "before": before,
+            "next_before": next_before,
+        },
+        headers=headers,
     )
 
+def send_email_digest(posts):
+    """Send the review digest; runs as a background task after the response."""
+    print("Sending email digest...")
+    if not content_generator.send_email_digest(posts):
+        print("Email digest failed to send. Check environment variables.")
+
 # Generate posts and send email with deduplication
 @app.post("/generate-posts")
-async def generate_posts():
+async def generate_posts(background_tasks: BackgroundTasks):
     try:
-        # 1. Get recent posts (last 30 days) to check for duplicates
-        recent_posts_data = await get_recent_posts(30)
+        # 1. Get recent posts (last 30 days) to check for duplicates while this
+        #    week's topics (which may call the trending API) are picked in a thread
+        recent_posts_data, topics = await asyncio.gather(
+            get_recent_posts(30),
+            asyncio.to_thread(content_generator.weekly_topics),
+        )
 
-        # 2. Generate new posts with deduplication
+        # 2. Generate new posts with deduplication (blocking HTTP calls run in a
+        #    worker thread so the event loop keeps serving other requests)
         print("Generating posts with deduplication...")
-        generated_posts_data = content_generator.generate_posts(existing_posts=recent_posts_data)
+        generated_posts_data = await asyncio.to_thread(
+            content_generator.generate_posts,
+            existing_posts=recent_posts_data,
+            topics=topics,
+        )
 
         if not generated_posts_data:
             print("No posts were generated.")
@@ -55,15 +208,21 @@ async def generate_posts():
 
         # 3. Save posts to the database (bulk insert)
         ids = await create_posts(generated_posts_data)
+        invalidate_dashboard_cache()
         print(f"Successfully generated and saved {len(ids)} posts.")
+        if not ids:
+            return {"message": "No new posts were saved."}
+        # Only the posts that were actually stored (not skipped duplicates) are mailed
+        generated_posts_data = stored_posts(generated_posts_data, ids)
 
-        # 4. Send the email digest
-        print("Sending email digest...")
-        email_sent = content_generator.send_email_digest(generated_posts_data)
-        if not email_sent:
-            print("Email digest failed to send. Check environment variables.")
+        # 4. Send the email digest once the response is out (sync task, so
+        #    FastAPI runs it in its threadpool)
+        if not content_generator.email_configured:
+            print("Email configuration incomplete; skipping email")
+            return {"message": f"{len(generated_posts_data)} posts generated"}
+        background_tasks.add_task(send_email_digest, generated_posts_data)
 
-        return {"message": f"{len(generated_posts_data)} posts generated and email sent successfully"}
+        return {"message": f"{len(generated_posts_data)} posts generated; email digest is being sent"}
 
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -75,7 +234,8 @@ async def approve_post(post_id: str):
     ok = await approve_post_db(post_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Post not found")
-    return {"message": "Post approved and others deleted"}
+    invalidate_dashboard_cache()
+    return json_body(APPROVED_BODY)
 
 # Edit post (manual or autosave)
 @app.post("/edit/{post_id}")
@@ -83,7 +243,8 @@ async def edit_post(post_id: str, content: str = Form(...)):
     ok = await update_post_content(post_id, content)
     if not ok:
         raise HTTPException(status_code=404, detail="Post not found")
-    return {"message": "Post updated"}
+    invalidate_dashboard_cache()
+    return json_body(UPDATED_BODY)
 
 # Delete post
 @app.post("/delete/{post_id}")
@@ -91,7 +252,8 @@ async def delete_post(post_id: str):
     ok = await delete_post_db(post_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Post not found")
-    return {"message": "Post deleted successfully"}
+    invalidate_dashboard_cache()
+    return json_body(DELETED_BODY)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,6 +1,7 @@
 # Automations/run_scheduler.py
 import asyncio
-from database import create_posts, get_recent_posts
+import atexit
+from database import create_posts, get_recent_posts, stored_posts
 from content_generator import ContentGenerator
 import os
 from datetime import datetime, timedelta
@@ -9,24 +10,45 @@ from dotenv import load_dotenv
 # Load .env file for local testing; GitHub Actions will use secrets
 load_dotenv()
 
-async def scheduled_generate():
-    api_key = os.getenv("PERPLEXITY_API_KEY")
-    if not api_key:
+# One generator per process, so every run reuses its pooled HTTP and SMTP connections
+_content_generator = None
+
+def get_content_generator():
+    global _content_generator
+    if _content_generator is None:
+        api_key = os.getenv("PERPLEXITY_API_KEY")
+        if not api_key:
+            return None
+        _content_generator = ContentGenerator(api_key)
+        atexit.register(_content_generator.close)
+    return _content_generator
+
+async def scheduled_generate(content_generator=None):
+    # Callers with their own generator (the web app's scheduler) pass it in
+    content_generator = content_generator or get_content_generator()
+    if content_generator is None:
         print("Error: PERPLEXITY_API_KEY not found.")
         return
 
-    content_generator = ContentGenerator(api_key)
     print("Generating posts with deduplication...")
     try:
         recent_posts_data = await get_recent_posts(30)
-        posts_data = content_generator.generate_posts(existing_posts=recent_posts_data)
+        # Perplexity (requests) and SMTP calls block, so they run in worker threads;
+        # the loop stays free when this job runs inside the web app
+        posts_data = await asyncio.to_thread(
+            content_generator.generate_posts, existing_posts=recent_posts_data
+        )
         if not posts_data:
             print("No posts were generated.")
             return
-        await create_posts(posts_data)
-        print(f"Successfully saved {len(posts_data)} posts.")
+        ids = await create_posts(posts_data)
+        print(f"Successfully saved {len(ids)} posts.")
+        if not ids:
+            return
+        # Only the posts that were actually stored (not skipped duplicates) are mailed
+        posts_data = stored_posts(posts_data, ids)
         print("Sending email digest...")
-        email_sent = content_generator.send_email_digest(posts_data)
+        email_sent = await asyncio.to_thread(content_generator.send_email_digest, posts_data)
         if not email_sent:
             print("Email digest failed to send. Check environment variables.")
     except Exception as e: